@@ -3,7 +3,19 @@ from single_source import get_version
 
 from .consumer import Consumer
 from .message import MessageAttributeValue, Message
-from .error import SQSException
+from .error import (
+    SQSException, HandlerTimeoutException, AbandonedHandlerLimitException
+)
+from .profiling import SlowMessage
+from .recording import MessageRecorder, replay
+from .tracing import TraceContext, Tracer, OpenTelemetryTracer
+from .transport import Transport, SQSTransport, InMemoryTransport
 
 __version__ = get_version(__name__, Path(__file__).parent.parent)
-__all__ = ["Consumer", "MessageAttributeValue", "Message", "SQSException"]
+__all__ = [
+    "Consumer", "MessageAttributeValue", "Message", "SQSException",
+    "HandlerTimeoutException", "AbandonedHandlerLimitException",
+    "SlowMessage", "MessageRecorder", "replay",
+    "TraceContext", "Tracer", "OpenTelemetryTracer", "Transport",
+    "SQSTransport", "InMemoryTransport"
+]
@@ -2,14 +2,66 @@
 SQS consumer
 """
 
+import contextvars
 import os
+import queue
 import boto3
+import signal
+import threading
 import time
 import traceback
+from collections import deque
+from concurrent.futures import Future, wait
+from contextlib import nullcontext
 from typing import List
 
-from .error import SQSException
+from .error import (
+    SQSException, HandlerTimeoutException, AbandonedHandlerLimitException
+)
 from .message import Message
+from .profiling import HandlerProfiler, SlowMessage
+from .tracing import TraceContext
+from .transport import SQSTransport
+
+
+class _HandlerWorker:
+    """
+    Long-lived daemon thread running handler calls one at a time.
+    """
+
+    def __init__(self):
+        self._calls = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args) -> Future:
+        # Run in a copy of the caller's context to keep the active span.
+        future = Future()
+        self._calls.put((future, contextvars.copy_context(), func, args))
+        return future
+
+    def stop(self):
+        """
+        Let the thread exit once its current call, if any, returns.
+        """
+        self._calls.put(None)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            future, context, func, args = call
+            try:
+                future.set_result(context.run(func, *args))
+            except BaseException as exception:
+                future.set_exception(exception)
 
 
 class Consumer:
@@ -17,6 +69,10 @@ class Consumer:
     SQS consumer implementation.
     """
 
+    # How long to wait for an abandoned handler call to return before
+    # checking again whether the consumer was stopped.
+    ABANDONED_HANDLER_WAIT_SECONDS = 0.1
+
     def __init__(
         self,
         queue_url,
@@ -27,7 +83,18 @@ class Consumer:
         batch_size=1,
         wait_time_seconds=1,
         visibility_timeout_seconds=None,
-        polling_wait_time_ms=0
+        polling_wait_time_ms=0,
+        slow_message_threshold_ms=None,
+        slow_message_history=100,
+        profile_sample_rate=0,
+        profile_memory=False,
+        profile_dump_signal=None,
+        recorder=None,
+        handler_timeout_seconds=None,
+        timeout_visibility_timeout_seconds=0,
+        max_abandoned_handlers=10,
+        tracer=None,
+        transport=None
     ):
         self.queue_url = queue_url
         self.attribute_names = attribute_names
@@ -41,16 +108,41 @@ class Consumer:
         self.wait_time_seconds = wait_time_seconds
         self.visibility_timeout_seconds = visibility_timeout_seconds
         self.polling_wait_time_ms = polling_wait_time_ms
-        if region:
-            self._sqs_client = sqs_client or boto3.client(
-                "sqs", region_name=region)
-        elif "AWS_DEFAULT_REGION" in os.environ:
-            # use boto3 default region
-            self._sqs_client = sqs_client or boto3.client(
-                "sqs", region_name=os.environ["AWS_DEFAULT_REGION"])
+
+        self.slow_message_threshold_ms = slow_message_threshold_ms
+        self.slow_messages = deque(maxlen=slow_message_history)
+        self.profiler = None
+        if profile_sample_rate:
+            self.profiler = HandlerProfiler(
+                profile_sample_rate, trace_memory=profile_memory)
+        if profile_dump_signal is not None and self.profiler is not None:
+            if threading.current_thread() is not threading.main_thread():
+                raise ValueError(
+                    "profile_dump_signal can only be set from the main thread")
+            signal.signal(profile_dump_signal, self._dump_profile_on_signal)
+        self.recorder = recorder
+        self.handler_timeout_seconds = handler_timeout_seconds
+        self.timeout_visibility_timeout_seconds = \
+            timeout_visibility_timeout_seconds
+        self.max_abandoned_handlers = max_abandoned_handlers
+        self._worker = None
+        self._abandoned_workers = []
+        self.tracer = tracer
+
+        if transport is not None:
+            self._transport = transport
         else:
-            raise Exception("Please specify the region parameter or set \
-                            AWS_DEFAULT_REGION env variable.")
+            if region:
+                self._sqs_client = sqs_client or boto3.client(
+                    "sqs", region_name=region)
+            elif "AWS_DEFAULT_REGION" in os.environ:
+                # use boto3 default region
+                self._sqs_client = sqs_client or boto3.client(
+                    "sqs", region_name=os.environ["AWS_DEFAULT_REGION"])
+            else:
+                raise Exception("Please specify the region parameter or set \
+                                AWS_DEFAULT_REGION env variable.")
+            self._transport = SQSTransport(self._sqs_client, queue_url)
         self._running = False
 
     def handle_message(self, message: Message):
@@ -103,29 +195,108 @@ class Consumer:
         """
         traceback.print_exc()
 
+    def handle_slow_message(self, slow_message: SlowMessage):
+        """
+        Called when handling a message took longer than
+        `slow_message_threshold_ms`. For message batches, this is called
+        for every message in the batch with the duration of the batch.
+        Calls sampled for profiling are not checked.
+
+        By default, this appends the record to `slow_messages`, which keeps
+        the latest `slow_message_history` records.
+        Override this method to write any custom logic.
+        """
+        self.slow_messages.append(slow_message)
+
+    def dump_profile(self, stream=None):
+        """
+        Write the aggregated handler profile to `stream`
+        (default `sys.stderr`). Does nothing if profiling is disabled.
+        """
+        if self.profiler is not None:
+            self.profiler.dump(stream)
+
+    def _dump_profile_on_signal(self, signum, frame):
+        # Signal handlers run on the main thread, possibly while it holds
+        # the profiler lock, so dump from a separate thread instead.
+        threading.Thread(target=self.dump_profile, daemon=True).start()
+
     def start(self):
         """
         Start the consumer.
         """
         # TODO: Figure out threading/daemon
         self._running = True
-        while self._running:
-            response = self._sqs_client.receive_message(
-                **self._sqs_client_params)
+        try:
+            while self._running:
+                if self._abandoned_handler_limit_reached():
+                    # Don't receive messages that could not be handled; wait
+                    # for the oldest abandoned call to return instead.
+                    self._abandoned_workers[0].join(
+                        self.ABANDONED_HANDLER_WAIT_SECONDS)
+                    continue
 
-            if not response.get("Messages", []):
-                self._polling_wait()
-                continue
+                receive_started_at = time.time_ns()
+                message_dicts = self._transport.receive_messages(
+                    **self._receive_params)
 
-            messages = [
-                Message.parse(message_dict)
-                for message_dict in response["Messages"]
-            ]
+                if not message_dicts:
+                    self._polling_wait()
+                    continue
+
+                messages = [
+                    Message.parse(message_dict)
+                    for message_dict in message_dicts
+                ]
+
+                if self.recorder is not None:
+                    self._record(message_dicts, messages)
+
+                contexts = self._trace(messages)
+                # Opened after the fact, so that empty polls are not traced and
+                # the span can link to the messages it received.
+                with self._span(
+                    "sqs.receive_message", messages, contexts,
+                    start_time=receive_started_at
+                ):
+                    pass
+
+                if self.batch_size == 1:
+                    self._process_message(messages[0], contexts)
+                else:
+                    self._process_message_batch(messages, contexts)
+        finally:
+            self._stop_worker()
+
+    @property
+    def abandoned_handlers(self) -> int:
+        """
+        Number of timed out handler calls that are still running.
+        """
+        self._abandoned_workers = [
+            worker for worker in self._abandoned_workers if worker.is_alive()
+        ]
+        return len(self._abandoned_workers)
 
+    def _record(self, message_dicts, messages: List[Message]):
+        # Recording is diagnostic; a failure must not keep the messages
+        # from being processed.
+        try:
+            self.recorder.record(message_dicts)
+        except Exception as exception:
             if self.batch_size == 1:
-                self._process_message(messages[0])
+                self.handle_processing_exception(messages[0], exception)
             else:
-                self._process_message_batch(messages)
+                self.handle_batch_processing_exception(messages, exception)
+
+    def _stop_worker(self):
+        if self._worker is not None:
+            self._worker.stop()
+            self._worker = None
+
+    def _abandoned_handler_limit_reached(self):
+        return self.handler_timeout_seconds is not None and \
+            self.abandoned_handlers >= self.max_abandoned_handlers
 
     def stop(self):
         """
@@ -134,61 +305,184 @@ class Consumer:
         # TODO: There's no way to invoke this other than a separate thread.
         self._running = False
 
-    def _process_message(self, message: Message):
+    def _process_message(self, message: Message, contexts=None):
         try:
-            self.handle_message(message)
-            self._delete_message(message)
+            with self._span(
+                "sqs.handle_message", [message], contexts, as_child=True
+            ):
+                self._call_handler(self.handle_message, message, [message])
+            with self._span(
+                "sqs.delete_message", [message], contexts, as_child=True
+            ):
+                self._delete_message(message)
+        except (
+            HandlerTimeoutException, AbandonedHandlerLimitException
+        ) as exception:
+            try:
+                self._release_message(message)
+            except SQSException as release_exception:
+                self.handle_processing_exception(message, release_exception)
+            self.handle_processing_exception(message, exception)
         except Exception as exception:
             self.handle_processing_exception(message, exception)
         finally:
             self._polling_wait()
 
-    def _process_message_batch(self, messages: List[Message]):
+    def _process_message_batch(self, messages: List[Message], contexts=None):
         try:
-            self.handle_message_batch(messages)
-            self._delete_message_batch(messages)
+            with self._span("sqs.handle_message_batch", messages, contexts):
+                self._call_handler(
+                    self.handle_message_batch, messages, messages)
+            with self._span("sqs.delete_message_batch", messages, contexts):
+                self._delete_message_batch(messages)
+        except (
+            HandlerTimeoutException, AbandonedHandlerLimitException
+        ) as exception:
+            try:
+                self._release_message_batch(messages)
+            except SQSException as release_exception:
+                self.handle_batch_processing_exception(
+                    messages, release_exception)
+            self.handle_batch_processing_exception(messages, exception)
         except Exception as exception:
             self.handle_batch_processing_exception(messages, exception)
         finally:
             self._polling_wait()
 
-    def _delete_message(self, message: Message):
+    def _call_handler(self, handler, argument, messages: List[Message]):
+        # Profiling slows handlers down, so profiled calls are not timed.
+        profiled = self.profiler is not None and self.profiler.should_sample()
+        start = time.perf_counter()
         try:
-            self._sqs_client.delete_message(
-                QueueUrl=self.queue_url,
-                ReceiptHandle=message.ReceiptHandle
+            if profiled:
+                self._run_with_timeout(
+                    self.profiler.profile, handler, argument)
+            else:
+                self._run_with_timeout(handler, argument)
+        finally:
+            if self.slow_message_threshold_ms is not None and not profiled:
+                duration_ms = (time.perf_counter() - start) * 1000
+                if duration_ms > self.slow_message_threshold_ms:
+                    for message in messages:
+                        self.handle_slow_message(
+                            SlowMessage.from_message(message, duration_ms))
+
+    def _run_with_timeout(self, func, *args):
+        if self.handler_timeout_seconds is None:
+            return func(*args)
+
+        if self._abandoned_handler_limit_reached():
+            raise AbandonedHandlerLimitException(
+                f"{self.abandoned_handlers} timed out handler calls are "
+                f"still running")
+        if self._worker is None:
+            self._worker = _HandlerWorker()
+
+        future = self._worker.submit(func, *args)
+        done, _ = wait([future], self.handler_timeout_seconds)
+        if not done:
+            # Threads cannot be killed, so abandon the worker stuck in the
+            # call and replace it on the next call.
+            self._worker.stop()
+            self._abandoned_workers.append(self._worker)
+            self._worker = None
+            raise HandlerTimeoutException(
+                f"Handler did not finish within "
+                f"{self.handler_timeout_seconds} seconds")
+        return future.result()
+
+    def _trace(self, messages: List[Message]):
+        """
+        Return the trace contexts of `messages` if they are sampled,
+        otherwise `None`.
+        """
+        if self.tracer is None:
+            return None
+        contexts = [TraceContext.extract(message) for message in messages]
+        if not self.tracer.should_sample(*contexts):
+            return None
+        return contexts
+
+    def _span(self, name, messages, contexts, as_child=False,
+              start_time=None):
+        """
+        Open a span for sampled `messages`. With `as_child`, the span
+        continues the trace of the single message; otherwise it links to
+        the traces of all messages.
+        """
+        if contexts is None:
+            return nullcontext()
+
+        attributes = {
+            "messaging.system": "aws_sqs",
+            "messaging.destination.name": self.queue_url
+        }
+        if as_child:
+            attributes["messaging.message.id"] = messages[0].MessageId
+            return self.tracer.start_span(
+                name,
+                parent=contexts[0],
+                attributes=attributes,
+                start_time=start_time
             )
+        attributes["messaging.batch.message_count"] = len(messages)
+        return self.tracer.start_span(
+            name,
+            links=[context for context in contexts if context is not None],
+            attributes=attributes,
+            start_time=start_time
+        )
+
+    def _delete_message(self, message: Message):
+        try:
+            self._transport.delete_message(message.ReceiptHandle)
         except Exception:
             raise SQSException("Failed to delete message")
 
     def _delete_message_batch(self, messages: List[Message]):
         try:
-            self._sqs_client.delete_message_batch(
-                QueueUrl=self.queue_url,
-                Entries=[
-                    {
-                        "Id": message.MessageId,
-                        "ReceiptHandle": message.ReceiptHandle
-                    }
-                    for message in messages
-                ]
-            )
+            self._transport.delete_message_batch([
+                {
+                    "Id": message.MessageId,
+                    "ReceiptHandle": message.ReceiptHandle
+                }
+                for message in messages
+            ])
         except Exception:
             raise SQSException("Failed to delete message batch")
 
+    def _release_message(self, message: Message):
+        try:
+            self._transport.change_message_visibility(
+                message.ReceiptHandle,
+                self.timeout_visibility_timeout_seconds
+            )
+        except Exception:
+            raise SQSException("Failed to release message")
+
+    def _release_message_batch(self, messages: List[Message]):
+        try:
+            self._transport.change_message_visibility_batch([
+                {
+                    "Id": message.MessageId,
+                    "ReceiptHandle": message.ReceiptHandle,
+                    "VisibilityTimeout":
+                        self.timeout_visibility_timeout_seconds
+                }
+                for message in messages
+            ])
+        except Exception:
+            raise SQSException("Failed to release message batch")
+
     @property
-    def _sqs_client_params(self):
-        params = {
-            "QueueUrl": self.queue_url,
-            "AttributeNames": self.attribute_names,
-            "MessageAttributeNames": self.message_attribute_names,
-            "MaxNumberOfMessages": self.batch_size,
-            "WaitTimeSeconds": self.wait_time_seconds,
+    def _receive_params(self):
+        return {
+            "max_number_of_messages": self.batch_size,
+            "wait_time_seconds": self.wait_time_seconds,
+            "visibility_timeout": self.visibility_timeout_seconds,
+            "attribute_names": self.attribute_names,
+            "message_attribute_names": self.message_attribute_names,
         }
-        if self.visibility_timeout_seconds is not None:
-            params["VisibilityTimeout"] = self.visibility_timeout_seconds
-
-        return params
 
     def _polling_wait(self):
         time.sleep(self.polling_wait_time_ms / 1000)
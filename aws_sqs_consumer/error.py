@@ -6,3 +6,13 @@ SQS consumer exceptions
 class SQSException(Exception):
     """Generic SQS message handling exception"""
     pass
+
+
+class HandlerTimeoutException(SQSException):
+    """Message handler did not finish within `handler_timeout_seconds`"""
+    pass
+
+
+class AbandonedHandlerLimitException(SQSException):
+    """Too many timed out handler calls are still running"""
+    pass
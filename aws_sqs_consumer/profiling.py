@@ -0,0 +1,144 @@
+"""
+Slow message detection and sampled handler profiling
+"""
+
+import cProfile
+import pstats
+import random
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict
+
+from .message import Message, MessageAttributeValue
+
+
+@dataclass
+class SlowMessage:
+    """Class representing a message whose handling exceeded the threshold"""
+    message_id: str = ""
+    attributes: Dict[str, str] = field(default_factory=dict)
+    message_attributes: Dict[str, MessageAttributeValue] = field(
+        default_factory=dict
+    )
+    size: int = 0
+    duration_ms: float = 0.0
+
+    @staticmethod
+    def from_message(message: Message, duration_ms: float):
+        return SlowMessage(
+            message_id=message.MessageId,
+            attributes=message.Attributes,
+            message_attributes=message.MessageAttributes,
+            size=message_size(message),
+            duration_ms=duration_ms
+        )
+
+
+def message_size(message: Message) -> int:
+    """
+    Approximate SQS size of a message in bytes, i.e. the body plus the
+    name, data type and value of each message attribute.
+    """
+    size = len(message.Body.encode("utf-8"))
+    for name, value in message.MessageAttributes.items():
+        size += len(name.encode("utf-8"))
+        size += len(value.DataType.encode("utf-8"))
+        size += len(value.StringValue.encode("utf-8"))
+        size += len(value.BinaryValue)
+        size += sum(len(item.encode("utf-8"))
+                    for item in value.StringListValues)
+        size += sum(len(item) for item in value.BinaryListValues)
+    return size
+
+
+class HandlerProfiler:
+    """
+    Runs a sampled fraction of handler calls under `cProfile` (and
+    optionally `tracemalloc`) and aggregates the results across calls.
+    """
+
+    def __init__(self, sample_rate, trace_memory=False):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(
+                "Sample rate should be between 0 and 1, both inclusive")
+        self.sample_rate = sample_rate
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Discard all aggregated statistics.
+        """
+        with self._lock:
+            self.sampled_calls = 0
+            self.peak_memory = 0
+            self._stats = None
+            self._allocations = Counter()
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def profile(self, func, *args):
+        """
+        Call `func(*args)` under the profiler and return its result.
+        Statistics are aggregated even if `func` raises.
+        """
+        profiler = cProfile.Profile()
+        # Leave tracemalloc alone if somebody else is already tracing.
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active in this thread; run unprofiled.
+            profiler = None
+        try:
+            return func(*args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            snapshot = None
+            peak_memory = 0
+            if start_tracing:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            self._aggregate(profiler, snapshot, peak_memory)
+
+    def _aggregate(self, profiler, snapshot, peak_memory):
+        with self._lock:
+            self.sampled_calls += 1
+            self.peak_memory = max(self.peak_memory, peak_memory)
+            if profiler is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profiler)
+                else:
+                    self._stats.add(profiler)
+            if snapshot is not None:
+                for stat in snapshot.statistics("lineno"):
+                    frame = stat.traceback[0]
+                    location = f"{frame.filename}:{frame.lineno}"
+                    self._allocations[location] += stat.size
+
+    def dump(self, stream=None, sort_by="cumulative", limit=30):
+        """
+        Write the aggregated statistics to `stream` (default `sys.stderr`).
+        """
+        stream = stream or sys.stderr
+        with self._lock:
+            stream.write(
+                f"Profiled {self.sampled_calls} handler call(s)\n")
+            if self._stats is not None:
+                self._stats.stream = stream
+                self._stats.sort_stats(sort_by).print_stats(limit)
+            if self._allocations:
+                stream.write(
+                    f"Peak traced memory: {self.peak_memory} bytes\n")
+                stream.write("Top allocations (bytes):\n")
+                for location, size in self._allocations.most_common(limit):
+                    stream.write(f"{size:>12}  {location}\n")
@@ -0,0 +1,135 @@
+"""
+Record and replay of received SQS messages
+"""
+
+import base64
+import gzip
+import json
+import threading
+import time
+from typing import Iterator, List, Tuple
+
+from .message import Message
+
+_BYTES_KEY = "$b64"
+
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return {_BYTES_KEY: base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Cannot record value of type {type(value).__name__}")
+
+
+def _decode_bytes(obj):
+    if len(obj) == 1 and _BYTES_KEY in obj:
+        return base64.b64decode(obj[_BYTES_KEY])
+    return obj
+
+
+def _open(path, mode, compress):
+    if compress:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class MessageRecorder:
+    """
+    Appends raw message dicts returned by `receive_message` to a JSONL file,
+    one line per receive call. Binary attribute values are base64 encoded.
+
+    The file is gzip compressed if `compress` is `True`, or if it is `None`
+    and `path` ends with `.gz`.
+    """
+
+    def __init__(self, path, compress=None):
+        self.path = str(path)
+        if compress is None:
+            compress = self.path.endswith(".gz")
+        self.compress = compress
+        self._file = _open(self.path, "a", compress)
+        self._lock = threading.Lock()
+
+    def record(self, message_dicts: List[dict]):
+        line = json.dumps(
+            {"received_at": time.time(), "messages": message_dicts},
+            separators=(",", ":"),
+            default=_encode_bytes
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_recording(path, compress=None) -> Iterator[Tuple[float, List[dict]]]:
+    """
+    Yield `(received_at, message_dicts)` for each receive call in a file
+    written by `MessageRecorder`.
+    """
+    path = str(path)
+    if compress is None:
+        compress = path.endswith(".gz")
+    with _open(path, "r", compress) as recording:
+        for line in recording:
+            if not line.strip():
+                continue
+            entry = json.loads(line, object_hook=_decode_bytes)
+            yield entry["received_at"], entry["messages"]
+
+
+def replay(consumer, path, realtime=False, compress=None) -> int:
+    """
+    Feed a recording through `consumer`'s handlers without touching SQS
+    and return the number of messages handled.
+
+    Messages are never deleted. Messages received together are passed to
+    `handle_message_batch` if `consumer.batch_size > 1`, otherwise one by
+    one to `handle_message`. With `realtime=True`, the original gaps
+    between receive calls are preserved; otherwise messages are replayed
+    as fast as possible.
+    """
+    count = 0
+    first_received_at = None
+    replay_start = time.monotonic()
+    try:
+        for received_at, message_dicts in read_recording(path, compress):
+            if realtime:
+                if first_received_at is None:
+                    first_received_at = received_at
+                delay = (received_at - first_received_at) - \
+                    (time.monotonic() - replay_start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            messages = [
+                Message.parse(message_dict) for message_dict in message_dicts
+            ]
+            if consumer.batch_size == 1:
+                for message in messages:
+                    try:
+                        consumer._call_handler(
+                            consumer.handle_message, message, [message])
+                    except Exception as exception:
+                        consumer.handle_processing_exception(
+                            message, exception)
+            elif messages:
+                try:
+                    consumer._call_handler(
+                        consumer.handle_message_batch, messages, messages)
+                except Exception as exception:
+                    consumer.handle_batch_processing_exception(
+                        messages, exception)
+            count += len(messages)
+    finally:
+        # Handler timeouts run on a worker thread; don't leave it behind.
+        consumer._stop_worker()
+    return count
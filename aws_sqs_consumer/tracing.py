@@ -0,0 +1,180 @@
+"""
+Distributed tracing propagation from SQS message attributes
+"""
+
+import random
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+from .message import Message
+
+TRACEPARENT_ATTRIBUTE = "traceparent"
+AWS_TRACE_HEADER_ATTRIBUTE = "AWSTraceHeader"
+
+
+@dataclass
+class TraceContext:
+    """Class representing the producer's trace context of a message"""
+    trace_id: str = ""
+    span_id: str = ""
+    sampled: Optional[bool] = None
+
+    @staticmethod
+    def parse_traceparent(value: str):
+        """
+        Parse a W3C `traceparent` header, e.g.
+        `00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01`.
+        Returns `None` if the header is malformed.
+        """
+        parts = value.strip().split("-")
+        if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        try:
+            if not int(parts[1], 16) or not int(parts[2], 16):
+                return None
+            flags = int(parts[3][:2], 16)
+        except ValueError:
+            return None
+        return TraceContext(
+            trace_id=parts[1].lower(),
+            span_id=parts[2].lower(),
+            sampled=bool(flags & 0x01)
+        )
+
+    @staticmethod
+    def parse_aws_trace_header(value: str):
+        """
+        Parse an X-Ray `AWSTraceHeader`, e.g.
+        `Root=1-<8 hex>-<24 hex>;Parent=<16 hex>;Sampled=1`.
+        Returns `None` if the header has no valid root or parent.
+        """
+        fields = dict(
+            field.strip().split("=", 1)
+            for field in value.split(";") if "=" in field
+        )
+        root = fields.get("Root", "").split("-")
+        parent = fields.get("Parent", "")
+        if len(root) != 3 or len(root[1] + root[2]) != 32 or len(parent) != 16:
+            return None
+        try:
+            int(root[1] + root[2], 16)
+            int(parent, 16)
+        except ValueError:
+            return None
+        return TraceContext(
+            trace_id=(root[1] + root[2]).lower(),
+            span_id=parent.lower(),
+            sampled={"1": True, "0": False}.get(fields.get("Sampled"))
+        )
+
+    @staticmethod
+    def extract(message: Message):
+        """
+        Extract the trace context of a message from its `traceparent`
+        message attribute or, failing that, its `AWSTraceHeader` attribute.
+        Returns `None` if the message carries no trace context.
+        """
+        traceparent = message.MessageAttributes.get(TRACEPARENT_ATTRIBUTE)
+        if traceparent is not None and traceparent.StringValue:
+            context = TraceContext.parse_traceparent(traceparent.StringValue)
+            if context is not None:
+                return context
+        aws_trace_header = message.Attributes.get(AWS_TRACE_HEADER_ATTRIBUTE)
+        if aws_trace_header:
+            return TraceContext.parse_aws_trace_header(aws_trace_header)
+        return None
+
+
+class Tracer(ABC):
+    """
+    Base class for tracing integrations.
+
+    Spans are only opened for sampled messages. A message is sampled if its
+    producer said so, otherwise with probability `sample_rate`. A batch is
+    sampled if any producer said so, and not sampled if all of them said
+    not to; otherwise `sample_rate` applies.
+    Override `start_span` to integrate your tracing library.
+    """
+
+    def __init__(self, sample_rate=1.0):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(
+                "Sample rate should be between 0 and 1, both inclusive")
+        self.sample_rate = sample_rate
+
+    def should_sample(self, *contexts: Optional[TraceContext]) -> bool:
+        decisions = [
+            context.sampled if context is not None else None
+            for context in contexts
+        ]
+        if any(decisions):
+            return True
+        if decisions and None not in decisions:
+            # Every producer decided against sampling.
+            return False
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @abstractmethod
+    def start_span(self, name, parent=None, links=(), attributes=None,
+                   start_time=None):
+        """
+        Return a context manager for a span called `name`.
+
+        Args:
+            parent: `TraceContext` of the producer, if any.
+            links: `TraceContext`s of received messages or a message batch.
+            attributes: Dictionary of span attributes.
+            start_time: Start of the span in nanoseconds since the epoch,
+                if it started before this call.
+        """
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Tracer creating OpenTelemetry spans. Requires `opentelemetry-api`.
+    """
+
+    def __init__(self, sample_rate=1.0, tracer_provider=None):
+        super().__init__(sample_rate)
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImportError(
+                "OpenTelemetryTracer requires the opentelemetry-api package")
+        self._trace = trace
+        self._tracer = trace.get_tracer(
+            __name__, tracer_provider=tracer_provider)
+
+    def start_span(self, name, parent=None, links=(), attributes=None,
+                   start_time=None):
+        trace = self._trace
+        context = None
+        if parent is not None:
+            # Only sampled messages get here, so mark the parent as sampled
+            # to keep parent based samplers from dropping the span.
+            context = trace.set_span_in_context(trace.NonRecordingSpan(
+                self._span_context(parent, sampled=True)))
+        return self._tracer.start_as_current_span(
+            name,
+            context=context,
+            kind=trace.SpanKind.CONSUMER,
+            links=[
+                trace.Link(self._span_context(link, link.sampled))
+                for link in links
+            ],
+            attributes=attributes,
+            start_time=start_time
+        )
+
+    def _span_context(self, context: TraceContext, sampled):
+        trace = self._trace
+        flags = trace.TraceFlags.DEFAULT
+        if sampled:
+            flags = trace.TraceFlags.SAMPLED
+        return trace.SpanContext(
+            trace_id=int(context.trace_id, 16),
+            span_id=int(context.span_id, 16),
+            is_remote=True,
+            trace_flags=trace.TraceFlags(flags)
+        )
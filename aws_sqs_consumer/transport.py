@@ -0,0 +1,297 @@
+"""
+Queue transports used by the consumer
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, List, Optional
+
+
+class Transport(ABC):
+    """
+    Base class for the queue operations used by `Consumer`.
+
+    Messages are exchanged as dicts in the shape returned by the SQS
+    `ReceiveMessage` API, and batch entries as in the SQS batch APIs.
+    """
+
+    @abstractmethod
+    def receive_messages(
+        self,
+        max_number_of_messages=1,
+        wait_time_seconds=0,
+        visibility_timeout=None,
+        attribute_names=(),
+        message_attribute_names=()
+    ) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def delete_message(self, receipt_handle):
+        ...
+
+    @abstractmethod
+    def delete_message_batch(self, entries: List[dict]):
+        ...
+
+    @abstractmethod
+    def change_message_visibility(self, receipt_handle, visibility_timeout):
+        ...
+
+    @abstractmethod
+    def change_message_visibility_batch(self, entries: List[dict]):
+        ...
+
+
+class SQSTransport(Transport):
+    """
+    Transport backed by a `boto3` SQS client.
+    """
+
+    def __init__(self, sqs_client, queue_url):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+
+    def receive_messages(
+        self,
+        max_number_of_messages=1,
+        wait_time_seconds=0,
+        visibility_timeout=None,
+        attribute_names=(),
+        message_attribute_names=()
+    ) -> List[dict]:
+        params = {
+            "QueueUrl": self.queue_url,
+            "AttributeNames": list(attribute_names),
+            "MessageAttributeNames": list(message_attribute_names),
+            "MaxNumberOfMessages": max_number_of_messages,
+            "WaitTimeSeconds": wait_time_seconds,
+        }
+        if visibility_timeout is not None:
+            params["VisibilityTimeout"] = visibility_timeout
+
+        response = self.sqs_client.receive_message(**params)
+        return response.get("Messages", [])
+
+    def delete_message(self, receipt_handle):
+        return self.sqs_client.delete_message(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=receipt_handle
+        )
+
+    def delete_message_batch(self, entries: List[dict]):
+        return self.sqs_client.delete_message_batch(
+            QueueUrl=self.queue_url,
+            Entries=entries
+        )
+
+    def change_message_visibility(self, receipt_handle, visibility_timeout):
+        return self.sqs_client.change_message_visibility(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=receipt_handle,
+            VisibilityTimeout=visibility_timeout
+        )
+
+    def change_message_visibility_batch(self, entries: List[dict]):
+        return self.sqs_client.change_message_visibility_batch(
+            QueueUrl=self.queue_url,
+            Entries=entries
+        )
+
+
+@dataclass
+class _InMemoryMessage:
+    message_id: str
+    body: str
+    message_attributes: Dict[str, dict] = field(default_factory=dict)
+    sent_timestamp: int = 0
+    first_receive_timestamp: Optional[int] = None
+    receive_count: int = 0
+    receipt_handle: Optional[str] = None
+    visible_at: float = 0.0
+
+
+def _matches(name, patterns):
+    for pattern in patterns:
+        if pattern in ("All", ".*") or pattern == name:
+            return True
+        if pattern.endswith(".*") and name.startswith(pattern[:-1]):
+            return True
+    return False
+
+
+class InMemoryTransport(Transport):
+    """
+    Thread-safe in-memory queue, for tests and benchmarks.
+
+    Honors visibility timeouts, receive counts, long polling and batch
+    limits. Only the latest receipt handle of a message is valid.
+    """
+
+    MAX_BATCH_SIZE = 10
+
+    def __init__(self, visibility_timeout_seconds=30):
+        self.visibility_timeout_seconds = visibility_timeout_seconds
+        self._messages = OrderedDict()
+        self._receipt_handles = {}
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        """Number of messages in the queue, including in-flight ones."""
+        with self._condition:
+            return len(self._messages)
+
+    def send_message(self, body, message_attributes=None, delay_seconds=0):
+        """
+        Add a message to the queue and return its `MessageId`.
+        `message_attributes` uses the shape of the SQS `SendMessage` API.
+        """
+        message = _InMemoryMessage(
+            message_id=str(uuid.uuid4()),
+            body=body,
+            message_attributes=dict(message_attributes or {}),
+            sent_timestamp=int(time.time() * 1000),
+            visible_at=time.monotonic() + delay_seconds
+        )
+        with self._condition:
+            self._messages[message.message_id] = message
+            self._condition.notify_all()
+        return message.message_id
+
+    def receive_messages(
+        self,
+        max_number_of_messages=1,
+        wait_time_seconds=0,
+        visibility_timeout=None,
+        attribute_names=(),
+        message_attribute_names=()
+    ) -> List[dict]:
+        if not 1 <= max_number_of_messages <= self.MAX_BATCH_SIZE:
+            raise ValueError(
+                "Batch size should be between 1 and 10, both inclusive")
+        if visibility_timeout is None:
+            visibility_timeout = self.visibility_timeout_seconds
+
+        deadline = time.monotonic() + wait_time_seconds
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                received = list(islice(
+                    (message for message in self._messages.values()
+                     if message.visible_at <= now),
+                    max_number_of_messages
+                ))
+                if received or now >= deadline:
+                    break
+                # Wake up when a message is sent or becomes visible again.
+                next_visible_at = min(
+                    (message.visible_at
+                     for message in self._messages.values()),
+                    default=deadline
+                )
+                self._condition.wait(
+                    max(0, min(deadline, next_visible_at) - now))
+
+            timestamp = int(time.time() * 1000)
+            for message in received:
+                message.receive_count += 1
+                if message.first_receive_timestamp is None:
+                    message.first_receive_timestamp = timestamp
+                self._receipt_handles.pop(message.receipt_handle, None)
+                message.receipt_handle = uuid.uuid4().hex
+                self._receipt_handles[message.receipt_handle] = message
+                message.visible_at = now + visibility_timeout
+
+            return [
+                self._message_dict(
+                    message, attribute_names, message_attribute_names)
+                for message in received
+            ]
+
+    def delete_message(self, receipt_handle):
+        with self._condition:
+            self._delete(self._lookup(receipt_handle))
+
+    def delete_message_batch(self, entries: List[dict]):
+        return self._batch(
+            entries, lambda message, entry: self._delete(message))
+
+    def change_message_visibility(self, receipt_handle, visibility_timeout):
+        with self._condition:
+            self._change_visibility(
+                self._lookup(receipt_handle), visibility_timeout)
+
+    def change_message_visibility_batch(self, entries: List[dict]):
+        return self._batch(
+            entries,
+            lambda message, entry: self._change_visibility(
+                message, entry["VisibilityTimeout"])
+        )
+
+    def _lookup(self, receipt_handle):
+        message = self._receipt_handles.get(receipt_handle)
+        if message is None:
+            raise ValueError(f"Invalid receipt handle: {receipt_handle}")
+        return message
+
+    def _delete(self, message):
+        del self._receipt_handles[message.receipt_handle]
+        del self._messages[message.message_id]
+
+    def _change_visibility(self, message, visibility_timeout):
+        message.visible_at = time.monotonic() + visibility_timeout
+        self._condition.notify_all()
+
+    def _batch(self, entries, operation):
+        if not 1 <= len(entries) <= self.MAX_BATCH_SIZE:
+            raise ValueError(
+                "Batch size should be between 1 and 10, both inclusive")
+        successful, failed = [], []
+        with self._condition:
+            for entry in entries:
+                message = self._receipt_handles.get(entry["ReceiptHandle"])
+                if message is None:
+                    failed.append({
+                        "Id": entry["Id"],
+                        "SenderFault": True,
+                        "Code": "ReceiptHandleIsInvalid",
+                    })
+                    continue
+                operation(message, entry)
+                successful.append({"Id": entry["Id"]})
+        return {"Successful": successful, "Failed": failed}
+
+    @staticmethod
+    def _message_dict(message, attribute_names, message_attribute_names):
+        message_dict = {
+            "MessageId": message.message_id,
+            "ReceiptHandle": message.receipt_handle,
+            "MD5OfBody": hashlib.md5(message.body.encode("utf-8")).hexdigest(),
+            "Body": message.body,
+        }
+        attributes = {
+            "SentTimestamp": str(message.sent_timestamp),
+            "ApproximateReceiveCount": str(message.receive_count),
+            "ApproximateFirstReceiveTimestamp":
+                str(message.first_receive_timestamp),
+        }
+        attributes = {
+            name: value for name, value in attributes.items()
+            if _matches(name, attribute_names)
+        }
+        if attributes:
+            message_dict["Attributes"] = attributes
+        message_attributes = {
+            name: dict(value)
+            for name, value in message.message_attributes.items()
+            if _matches(name, message_attribute_names)
+        }
+        if message_attributes:
+            message_dict["MessageAttributes"] = message_attributes
+        return message_dict
@@ -0,0 +1,242 @@
+import threading
+import time
+import unittest
+from typing import List
+
+from aws_sqs_consumer import (
+    Consumer, Message, HandlerTimeoutException,
+    AbandonedHandlerLimitException, InMemoryTransport
+)
+from .utils import async_in_memory
+
+
+class TestHandlerTimeout(unittest.TestCase):
+    def setUp(self) -> None:
+        self.hang = threading.Event()
+
+    def tearDown(self) -> None:
+        # Let abandoned handlers finish
+        self.hang.set()
+
+    def test_message_timeout_released(self):
+        messages = []
+        exceptions = []
+        hang = self.hang
+        attempted = False
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                nonlocal attempted
+                if not attempted:
+                    attempted = True
+                    hang.wait()
+                messages.append(message.Body)
+
+            def handle_processing_exception(self, message: Message, exception):
+                exceptions.append(exception)
+
+        with async_in_memory(
+            TestConsumer,
+            handler_timeout_seconds=0.2
+        ) as transport:
+            transport.send_message("test_message")
+
+        self.assertEqual(messages, ["test_message"])
+        self.assertEqual(len(exceptions), 1)
+        self.assertEqual(type(exceptions[0]), HandlerTimeoutException)
+
+    def test_message_batch_timeout_released(self):
+        message_batches = []
+        exceptions = []
+        hang = self.hang
+        attempted = False
+
+        class TestBatchConsumer(Consumer):
+            def handle_message_batch(self, messages: List[Message]):
+                nonlocal attempted
+                if not attempted:
+                    attempted = True
+                    hang.wait()
+                message_batches.append(
+                    [message.Body for message in messages])
+
+            def handle_batch_processing_exception(self, messages, exception):
+                exceptions.append(exception)
+
+        with async_in_memory(
+            TestBatchConsumer,
+            batch_size=5,
+            handler_timeout_seconds=0.2
+        ) as transport:
+            for i in range(3):
+                transport.send_message(f"test message {i}")
+
+        self.assertEqual(
+            sorted(sum(message_batches, [])),
+            [f"test message {i}" for i in range(3)]
+        )
+        self.assertEqual(len(exceptions), 1)
+        self.assertEqual(type(exceptions[0]), HandlerTimeoutException)
+
+    def test_handler_exception_within_timeout(self):
+        exceptions = []
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                raise Exception("Failed to handle message")
+
+            def handle_processing_exception(self, message: Message, exception):
+                exceptions.append(exception)
+
+        # The message is never deleted, so only wait for it to be handled.
+        with async_in_memory(
+            TestConsumer,
+            timeout_seconds=0.2,
+            handler_timeout_seconds=5
+        ) as transport:
+            transport.send_message("test_message")
+
+        self.assertEqual(len(exceptions), 1)
+        self.assertEqual(type(exceptions[0]), Exception)
+        self.assertEqual(str(exceptions[0]), "Failed to handle message")
+
+
+class TestHandlerWorker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.hang = threading.Event()
+
+    def tearDown(self) -> None:
+        self.hang.set()
+
+    def test_worker_reused(self):
+        thread_ids = set()
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                thread_ids.add(threading.get_ident())
+
+        with async_in_memory(
+            TestConsumer,
+            handler_timeout_seconds=5
+        ) as transport:
+            for i in range(50):
+                transport.send_message(f"test message {i}")
+
+        self.assertEqual(len(transport), 0)
+        self.assertEqual(len(thread_ids), 1)
+        self.assertNotIn(threading.get_ident(), thread_ids)
+
+    def test_handler_timeout_error_not_a_timeout(self):
+        exceptions = []
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                raise TimeoutError("handler timeout error")
+
+            def handle_processing_exception(self, message: Message, exception):
+                exceptions.append(exception)
+
+        with async_in_memory(
+            TestConsumer,
+            timeout_seconds=0.1,
+            handler_timeout_seconds=5
+        ) as transport:
+            transport.send_message("test_message")
+
+        self.assertEqual(type(exceptions[0]), TimeoutError)
+
+    def test_max_abandoned_handlers(self):
+        consumers = []
+        exceptions = []
+        hang = self.hang
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                consumers.append(self)
+                hang.wait()
+
+            def handle_processing_exception(self, message: Message, exception):
+                exceptions.append(exception)
+
+        with async_in_memory(
+            TestConsumer,
+            timeout_seconds=0.5,
+            handler_timeout_seconds=0.05,
+            max_abandoned_handlers=2
+        ) as transport:
+            for i in range(3):
+                transport.send_message(f"test message {i}")
+
+        consumer = consumers[0]
+        self.assertEqual(consumer.abandoned_handlers, 2)
+        self.assertEqual(
+            [type(exception) for exception in exceptions],
+            [HandlerTimeoutException, HandlerTimeoutException]
+        )
+        # Timed out messages were released and, once the limit was
+        # reached, no further messages were received.
+        received = transport.receive_messages(
+            max_number_of_messages=10,
+            attribute_names=["ApproximateReceiveCount"]
+        )
+        self.assertEqual(len(received), 3)
+        self.assertEqual(sum(
+            int(message["Attributes"]["ApproximateReceiveCount"]) - 1
+            for message in received
+        ), 2)
+
+        self.hang.set()
+        deadline = time.monotonic() + 5
+        while consumer.abandoned_handlers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(consumer.abandoned_handlers, 0)
+
+    def test_refused_message_released(self):
+        transport = InMemoryTransport()
+        consumer = Consumer(
+            queue_url="in-memory",
+            transport=transport,
+            handler_timeout_seconds=1,
+            max_abandoned_handlers=0
+        )
+        exceptions = []
+        consumer.handle_processing_exception = \
+            lambda message, exception: exceptions.append(exception)
+
+        transport.send_message("test_message")
+        message = Message.parse(transport.receive_messages()[0])
+        consumer._process_message(message)
+
+        self.assertEqual(
+            [type(exception) for exception in exceptions],
+            [AbandonedHandlerLimitException]
+        )
+        self.assertEqual(len(transport.receive_messages()), 1)
+
+    def test_worker_stopped_on_error(self):
+        worker_threads = []
+
+        class FailingTransport(InMemoryTransport):
+            def receive_messages(self, *args, **kwargs):
+                messages = super().receive_messages(*args, **kwargs)
+                if not messages:
+                    raise Exception("receive failed")
+                return messages
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                worker_threads.append(threading.current_thread())
+
+        transport = FailingTransport()
+        transport.send_message("test_message")
+        consumer = TestConsumer(
+            queue_url="in-memory",
+            transport=transport,
+            wait_time_seconds=0,
+            handler_timeout_seconds=1
+        )
+        with self.assertRaisesRegex(Exception, "receive failed"):
+            consumer.start()
+
+        worker_threads[0].join(1)
+        self.assertFalse(worker_threads[0].is_alive())
@@ -0,0 +1,181 @@
+import io
+import os
+import signal
+import threading
+import time
+import unittest
+
+from aws_sqs_consumer import Consumer, Message, SlowMessage
+from aws_sqs_consumer.profiling import HandlerProfiler, message_size
+from .utils import async_in_memory
+
+
+class TestSlowMessages(unittest.TestCase):
+    def test_slow_message_recorded(self):
+        consumers = []
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                consumers.append(self)
+                if message.Body == "slow":
+                    time.sleep(0.1)
+
+        with async_in_memory(
+            TestConsumer, slow_message_threshold_ms=50
+        ) as transport:
+            transport.send_message("fast")
+            transport.send_message("slow")
+
+        slow_messages = list(consumers[0].slow_messages)
+        self.assertEqual(len(slow_messages), 1)
+        self.assertEqual(type(slow_messages[0]), SlowMessage)
+        self.assertTrue(slow_messages[0].message_id)
+        self.assertEqual(slow_messages[0].size, len("slow"))
+        self.assertGreaterEqual(slow_messages[0].duration_ms, 50)
+
+    def test_slow_message_batch(self):
+        slow_messages = []
+
+        class TestConsumer(Consumer):
+            def handle_message_batch(self, messages):
+                time.sleep(0.1)
+
+            def handle_slow_message(self, slow_message: SlowMessage):
+                slow_messages.append(slow_message)
+
+        with async_in_memory(
+            TestConsumer, batch_size=5, slow_message_threshold_ms=50
+        ) as transport:
+            for i in range(3):
+                transport.send_message(f"message {i}")
+
+        self.assertEqual(len(slow_messages), 3)
+
+    def test_profiled_message_not_timed(self):
+        slow_messages = []
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                time.sleep(0.1)
+
+            def handle_slow_message(self, slow_message: SlowMessage):
+                slow_messages.append(slow_message)
+
+        with async_in_memory(
+            TestConsumer,
+            slow_message_threshold_ms=50,
+            profile_sample_rate=1
+        ) as transport:
+            transport.send_message("slow")
+
+        self.assertEqual(slow_messages, [])
+
+
+class TestHandlerProfiler(unittest.TestCase):
+    def test_invalid_sample_rate(self):
+        with self.assertRaises(ValueError):
+            HandlerProfiler(1.5)
+
+    def test_profile_aggregates_calls(self):
+        def handler(message):
+            return [i for i in range(1000)]
+
+        profiler = HandlerProfiler(1, trace_memory=True)
+        self.assertTrue(profiler.should_sample())
+        for _ in range(3):
+            self.assertEqual(len(profiler.profile(handler, None)), 1000)
+        self.assertEqual(profiler.sampled_calls, 3)
+        self.assertGreater(profiler.peak_memory, 0)
+
+        stream = io.StringIO()
+        profiler.dump(stream)
+        output = stream.getvalue()
+        self.assertIn("Profiled 3 handler call(s)", output)
+        self.assertIn("handler", output)
+
+        profiler.reset()
+        self.assertEqual(profiler.sampled_calls, 0)
+
+    def test_profile_exception(self):
+        def handler(message):
+            raise Exception("handle exception")
+
+        profiler = HandlerProfiler(1)
+        with self.assertRaisesRegex(Exception, "handle exception"):
+            profiler.profile(handler, None)
+        self.assertEqual(profiler.sampled_calls, 1)
+
+    def test_never_sample(self):
+        self.assertFalse(HandlerProfiler(0).should_sample())
+
+    def test_message_size(self):
+        message = Message.parse({
+            "Body": "body",
+            "MessageAttributes": {
+                "attr": {"DataType": "String", "StringValue": "value"}
+            }
+        })
+        self.assertEqual(message_size(message), 4 + 4 + 6 + 5)
+
+
+@unittest.skipUnless(hasattr(signal, "SIGUSR1"), "SIGUSR1 not available")
+class TestProfileDumpSignal(unittest.TestCase):
+    def setUp(self) -> None:
+        self.previous_handler = signal.getsignal(signal.SIGUSR1)
+
+    def tearDown(self) -> None:
+        signal.signal(signal.SIGUSR1, self.previous_handler)
+
+    def test_signal_during_aggregation(self):
+        dumped = threading.Event()
+
+        class TestConsumer(Consumer):
+            def dump_profile(self, stream=None):
+                super().dump_profile(io.StringIO())
+                dumped.set()
+
+        consumer = TestConsumer(
+            queue_url="https://eu-west-1.queue.amazonaws.com/1/test_queue",
+            region="eu-west-1",
+            profile_sample_rate=1,
+            profile_dump_signal=signal.SIGUSR1
+        )
+
+        # Holding the lock stands in for `_aggregate` on the main thread;
+        # the signal handler must return instead of waiting for it.
+        with consumer.profiler._lock:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertFalse(dumped.wait(0.1))
+        self.assertTrue(dumped.wait(5))
+
+    def test_not_installed_without_profiling(self):
+        Consumer(
+            queue_url="https://eu-west-1.queue.amazonaws.com/1/test_queue",
+            region="eu-west-1",
+            profile_dump_signal=signal.SIGUSR1
+        )
+        self.assertEqual(
+            signal.getsignal(signal.SIGUSR1), self.previous_handler)
+
+    def test_main_thread_required(self):
+        exceptions = []
+
+        def create_consumer():
+            try:
+                Consumer(
+                    queue_url="https://eu-west-1.queue.amazonaws.com/1/q",
+                    region="eu-west-1",
+                    profile_sample_rate=1,
+                    profile_dump_signal=signal.SIGUSR1
+                )
+            except Exception as exception:
+                exceptions.append(exception)
+
+        thread = threading.Thread(target=create_consumer)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(len(exceptions), 1)
+        self.assertEqual(type(exceptions[0]), ValueError)
+        self.assertEqual(
+            signal.getsignal(signal.SIGUSR1), self.previous_handler)
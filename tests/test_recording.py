@@ -0,0 +1,163 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from typing import List
+
+from aws_sqs_consumer import Consumer, Message, MessageRecorder, replay
+from aws_sqs_consumer.recording import read_recording
+from .utils import async_in_memory
+
+
+class TestRecording(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "messages.jsonl")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_record_received_messages(self):
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                pass
+
+        with MessageRecorder(self.path) as recorder:
+            with async_in_memory(
+                TestConsumer,
+                recorder=recorder,
+                message_attribute_names=["All"]
+            ) as transport:
+                transport.send_message(
+                    "test_message",
+                    message_attributes={
+                        "attr": {
+                            "DataType": "Binary",
+                            "BinaryValue": b"attr_value"
+                        }
+                    }
+                )
+
+        entries = list(read_recording(self.path))
+        self.assertEqual(len(entries), 1)
+        message = Message.parse(entries[0][1][0])
+        self.assertEqual(message.Body, "test_message")
+        self.assertEqual(
+            message.MessageAttributes["attr"].BinaryValue, b"attr_value")
+
+    def test_compressed_roundtrip(self):
+        path = self.path + ".gz"
+        with MessageRecorder(path) as recorder:
+            recorder.record([{"MessageId": "m1", "Body": "body 1"}])
+        with MessageRecorder(path) as recorder:
+            self.assertTrue(recorder.compress)
+            recorder.record([{"MessageId": "m2", "Body": "body 2"}])
+
+        entries = list(read_recording(path))
+        self.assertEqual(
+            [entry[1][0]["Body"] for entry in entries], ["body 1", "body 2"])
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "messages.jsonl")
+        self.queue_url = \
+            "https://eu-west-1.queue.amazonaws.com/123456789012/test_queue"
+        with MessageRecorder(self.path) as recorder:
+            recorder.record([
+                {"MessageId": f"m{i}", "Body": f"body {i}"} for i in range(3)
+            ])
+            time.sleep(0.2)
+            recorder.record([{"MessageId": "m3", "Body": "body 3"}])
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_replay_messages(self):
+        messages = []
+        exceptions = []
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                if message.MessageId == "m1":
+                    raise Exception("handle exception")
+                messages.append(message.Body)
+
+            def handle_processing_exception(self, message, exception):
+                exceptions.append(exception)
+
+        consumer = TestConsumer(queue_url=self.queue_url, region="eu-west-1")
+        start = time.monotonic()
+        count = replay(consumer, self.path)
+
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertEqual(count, 4)
+        self.assertEqual(messages, ["body 0", "body 2", "body 3"])
+        self.assertEqual(len(exceptions), 1)
+
+    def test_replay_batches_realtime(self):
+        batches = []
+
+        class TestConsumer(Consumer):
+            def handle_message_batch(self, messages: List[Message]):
+                batches.append([message.Body for message in messages])
+
+        consumer = TestConsumer(
+            queue_url=self.queue_url, region="eu-west-1", batch_size=5)
+        start = time.monotonic()
+        count = replay(consumer, self.path, realtime=True)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(count, 4)
+        self.assertEqual(
+            batches, [["body 0", "body 1", "body 2"], ["body 3"]])
+
+    def test_replay_stops_handler_worker(self):
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                pass
+
+        consumer = TestConsumer(
+            queue_url=self.queue_url,
+            region="eu-west-1",
+            handler_timeout_seconds=5
+        )
+        active_threads = threading.active_count()
+        for _ in range(5):
+            replay(consumer, self.path)
+
+        self.assertIsNone(consumer._worker)
+        deadline = time.monotonic() + 5
+        while threading.active_count() > active_threads and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(threading.active_count(), active_threads)
+
+
+class TestRecordingFailure(unittest.TestCase):
+    def test_record_error_reported(self):
+        messages = []
+        exceptions = []
+
+        class FailingRecorder:
+            def record(self, message_dicts):
+                raise OSError("No space left on device")
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                messages.append(message.Body)
+
+            def handle_processing_exception(self, message: Message, exception):
+                exceptions.append(exception)
+
+        with async_in_memory(
+            TestConsumer, recorder=FailingRecorder()
+        ) as transport:
+            transport.send_message("test_message")
+
+        self.assertEqual(messages, ["test_message"])
+        self.assertEqual(len(transport), 0)
+        self.assertEqual(len(exceptions), 1)
+        self.assertEqual(type(exceptions[0]), OSError)
@@ -0,0 +1,272 @@
+import contextlib
+import time
+import unittest
+from typing import List
+
+from aws_sqs_consumer import Consumer, Message, TraceContext, Tracer
+from .utils import async_in_memory
+
+try:
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import \
+        InMemorySpanExporter
+except ImportError:
+    TracerProvider = None
+
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+SPAN_ID = "b7ad6b7169203331"
+
+
+class RecordingTracer(Tracer):
+    def __init__(self, sample_rate=1.0):
+        super().__init__(sample_rate)
+        self.spans = []
+
+    @contextlib.contextmanager
+    def start_span(self, name, parent=None, links=(), attributes=None,
+                   start_time=None):
+        self.spans.append((name, parent, list(links), start_time))
+        yield
+
+
+class TestTraceContext(unittest.TestCase):
+    def test_parse_traceparent(self):
+        context = TraceContext.parse_traceparent(f"00-{TRACE_ID}-{SPAN_ID}-01")
+        self.assertEqual(context, TraceContext(TRACE_ID, SPAN_ID, True))
+
+        context = TraceContext.parse_traceparent(f"00-{TRACE_ID}-{SPAN_ID}-00")
+        self.assertFalse(context.sampled)
+
+    def test_parse_invalid_traceparent(self):
+        self.assertIsNone(TraceContext.parse_traceparent("invalid"))
+        self.assertIsNone(
+            TraceContext.parse_traceparent(f"00-{'0' * 32}-{SPAN_ID}-01"))
+        self.assertIsNone(
+            TraceContext.parse_traceparent(f"00-{'x' * 32}-{SPAN_ID}-01"))
+
+    def test_parse_aws_trace_header(self):
+        context = TraceContext.parse_aws_trace_header(
+            "Root=1-5759e988-bd862e3fe1be46a994272793;"
+            "Parent=53995c3f42cd8ad8;Sampled=1"
+        )
+        self.assertEqual(context.trace_id, "5759e988bd862e3fe1be46a994272793")
+        self.assertEqual(context.span_id, "53995c3f42cd8ad8")
+        self.assertTrue(context.sampled)
+
+        context = TraceContext.parse_aws_trace_header(
+            "Root=1-5759e988-bd862e3fe1be46a994272793;Parent=53995c3f42cd8ad8"
+        )
+        self.assertIsNone(context.sampled)
+
+        self.assertIsNone(TraceContext.parse_aws_trace_header(
+            "Root=1-5759e988-bd862e3fe1be46a994272793"))
+
+    def test_extract(self):
+        message = Message.parse({
+            "Attributes": {
+                "AWSTraceHeader":
+                    "Root=1-5759e988-bd862e3fe1be46a994272793;"
+                    "Parent=53995c3f42cd8ad8;Sampled=0"
+            },
+            "MessageAttributes": {
+                "traceparent": {
+                    "DataType": "String",
+                    "StringValue": f"00-{TRACE_ID}-{SPAN_ID}-01"
+                }
+            }
+        })
+        self.assertEqual(TraceContext.extract(message).trace_id, TRACE_ID)
+
+        message.MessageAttributes = {}
+        self.assertEqual(
+            TraceContext.extract(message).trace_id,
+            "5759e988bd862e3fe1be46a994272793"
+        )
+
+        message.Attributes = {}
+        self.assertIsNone(TraceContext.extract(message))
+
+
+class TestTracerSampling(unittest.TestCase):
+    def test_producer_decision(self):
+        tracer = RecordingTracer(sample_rate=0)
+        self.assertTrue(
+            tracer.should_sample(TraceContext(TRACE_ID, SPAN_ID, True)))
+        self.assertFalse(
+            RecordingTracer(sample_rate=1).should_sample(
+                TraceContext(TRACE_ID, SPAN_ID, False)))
+
+    def test_batch_decision(self):
+        sampled = TraceContext(TRACE_ID, SPAN_ID, True)
+        unsampled = TraceContext(TRACE_ID, SPAN_ID, False)
+        undecided = TraceContext(TRACE_ID, SPAN_ID, None)
+        for sample_rate in [0, 1]:
+            tracer = RecordingTracer(sample_rate=sample_rate)
+            self.assertTrue(tracer.should_sample(unsampled, sampled, None))
+            self.assertFalse(tracer.should_sample(unsampled, unsampled))
+            self.assertEqual(
+                tracer.should_sample(unsampled, undecided), bool(sample_rate))
+            self.assertEqual(
+                tracer.should_sample(unsampled, None), bool(sample_rate))
+
+    def test_sample_rate(self):
+        self.assertTrue(RecordingTracer(sample_rate=1).should_sample(None))
+        self.assertFalse(RecordingTracer(sample_rate=0).should_sample(None))
+        with self.assertRaises(ValueError):
+            RecordingTracer(sample_rate=2)
+
+    def test_start_span_required(self):
+        class IncompleteTracer(Tracer):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteTracer()
+
+
+class TestConsumerTracing(unittest.TestCase):
+    def send_traced_message(self, transport, body, flags="01"):
+        transport.send_message(
+            body,
+            message_attributes={
+                "traceparent": {
+                    "DataType": "String",
+                    "StringValue": f"00-{TRACE_ID}-{SPAN_ID}-{flags}"
+                }
+            }
+        )
+
+    def test_message_spans(self):
+        tracer = RecordingTracer(sample_rate=0)
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                pass
+
+        with async_in_memory(
+            TestConsumer,
+            tracer=tracer,
+            message_attribute_names=["traceparent"]
+        ) as transport:
+            self.send_traced_message(transport, "sampled")
+            self.send_traced_message(transport, "unsampled", "00")
+
+        self.assertEqual(
+            [span[0] for span in tracer.spans],
+            ["sqs.receive_message", "sqs.handle_message", "sqs.delete_message"]
+        )
+        receive_span = tracer.spans[0]
+        self.assertIsNone(receive_span[1])
+        self.assertEqual(
+            [context.trace_id for context in receive_span[2]], [TRACE_ID])
+        self.assertIsNotNone(receive_span[3])
+        self.assertEqual(tracer.spans[1][1].trace_id, TRACE_ID)
+
+    def test_empty_polls_not_traced(self):
+        tracer = RecordingTracer(sample_rate=1)
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                pass
+
+        with async_in_memory(
+            TestConsumer,
+            tracer=tracer,
+            wait_time_seconds=0,
+            polling_wait_time_ms=10
+        ):
+            time.sleep(0.05)
+
+        self.assertEqual(tracer.spans, [])
+
+    def test_message_batch_links(self):
+        tracer = RecordingTracer(sample_rate=0)
+
+        class TestBatchConsumer(Consumer):
+            def handle_message_batch(self, messages: List[Message]):
+                pass
+
+        with async_in_memory(
+            TestBatchConsumer,
+            batch_size=5,
+            tracer=tracer,
+            message_attribute_names=["traceparent"]
+        ) as transport:
+            for i in range(3):
+                self.send_traced_message(transport, f"test message {i}")
+
+        for name in ["sqs.receive_message", "sqs.handle_message_batch"]:
+            spans = [span for span in tracer.spans if span[0] == name]
+            self.assertEqual(sum(len(span[2]) for span in spans), 3)
+            self.assertTrue(all(span[1] is None for span in spans))
+
+    @unittest.skipIf(TracerProvider is None, "opentelemetry-sdk not installed")
+    def test_opentelemetry_tracer(self):
+        from aws_sqs_consumer import OpenTelemetryTracer
+
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        tracer = OpenTelemetryTracer(sample_rate=0, tracer_provider=provider)
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                pass
+
+        with async_in_memory(
+            TestConsumer,
+            tracer=tracer,
+            message_attribute_names=["traceparent"],
+            handler_timeout_seconds=5
+        ) as transport:
+            self.send_traced_message(transport, "test_message")
+
+        spans = {span.name: span for span in exporter.get_finished_spans()}
+        self.assertEqual(
+            set(spans),
+            {"sqs.receive_message", "sqs.handle_message", "sqs.delete_message"}
+        )
+        receive_span = spans["sqs.receive_message"]
+        self.assertEqual(
+            [link.context.span_id for link in receive_span.links],
+            [int(SPAN_ID, 16)]
+        )
+        self.assertLessEqual(
+            receive_span.start_time, spans["sqs.handle_message"].start_time)
+        handle_span = spans["sqs.handle_message"]
+        self.assertEqual(handle_span.context.trace_id, int(TRACE_ID, 16))
+        self.assertEqual(handle_span.parent.span_id, int(SPAN_ID, 16))
+
+
+@unittest.skipIf(TracerProvider is None, "opentelemetry-sdk not installed")
+class TestOpenTelemetryTracer(unittest.TestCase):
+    def setUp(self) -> None:
+        from aws_sqs_consumer import OpenTelemetryTracer
+
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        self.tracer = OpenTelemetryTracer(tracer_provider=provider)
+
+    def test_parent_marked_sampled(self):
+        parent = TraceContext(TRACE_ID, SPAN_ID, None)
+        with self.tracer.start_span("test", parent=parent):
+            pass
+
+        span = self.exporter.get_finished_spans()[0]
+        self.assertTrue(span.parent.trace_flags.sampled)
+
+    def test_links_keep_producer_decision(self):
+        links = [
+            TraceContext(TRACE_ID, SPAN_ID, True),
+            TraceContext(TRACE_ID, "a" * 16, False),
+            TraceContext(TRACE_ID, "b" * 16, None)
+        ]
+        with self.tracer.start_span("test", links=links):
+            pass
+
+        span = self.exporter.get_finished_spans()[0]
+        self.assertEqual(
+            [link.context.trace_flags.sampled for link in span.links],
+            [True, False, False]
+        )
@@ -0,0 +1,251 @@
+import boto3
+import threading
+import time
+import unittest
+from moto import mock_sqs
+from typing import List
+
+from aws_sqs_consumer import (
+    Consumer, Message, Transport, SQSTransport, InMemoryTransport,
+    HandlerTimeoutException
+)
+from .utils import async_in_memory
+
+
+class TestTransport(unittest.TestCase):
+    def test_methods_required(self):
+        class IncompleteTransport(Transport):
+            def receive_messages(self, *args, **kwargs):
+                return []
+
+        with self.assertRaises(TypeError):
+            IncompleteTransport()
+
+
+class TestSQSTransport(unittest.TestCase):
+    @mock_sqs
+    def test_change_message_visibility(self):
+        sqs_client = boto3.client("sqs", region_name="eu-west-1")
+        queue = sqs_client.create_queue(QueueName="test_queue")
+        transport = SQSTransport(sqs_client, queue["QueueUrl"])
+        for i in range(3):
+            sqs_client.send_message(
+                QueueUrl=queue["QueueUrl"], MessageBody=f"test message {i}")
+
+        first = transport.receive_messages(
+            max_number_of_messages=1, visibility_timeout=30)
+        transport.change_message_visibility(first[0]["ReceiptHandle"], 0)
+        batch = transport.receive_messages(
+            max_number_of_messages=10, visibility_timeout=30)
+        self.assertEqual(len(batch), 3)
+
+        response = transport.change_message_visibility_batch([
+            {
+                "Id": message["MessageId"],
+                "ReceiptHandle": message["ReceiptHandle"],
+                "VisibilityTimeout": 0
+            }
+            for message in batch
+        ])
+        self.assertEqual(len(response["Successful"]), 3)
+        self.assertEqual(
+            len(transport.receive_messages(max_number_of_messages=10)), 3)
+
+
+class TestInMemoryTransport(unittest.TestCase):
+    def setUp(self) -> None:
+        self.transport = InMemoryTransport(visibility_timeout_seconds=30)
+
+    def test_receive_and_delete(self):
+        message_id = self.transport.send_message("test_message")
+
+        messages = self.transport.receive_messages()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]["MessageId"], message_id)
+        self.assertEqual(messages[0]["Body"], "test_message")
+        self.assertTrue(messages[0]["MD5OfBody"])
+
+        self.transport.delete_message(messages[0]["ReceiptHandle"])
+        self.assertEqual(len(self.transport), 0)
+        with self.assertRaises(ValueError):
+            self.transport.delete_message(messages[0]["ReceiptHandle"])
+
+    def test_visibility_timeout(self):
+        self.transport.send_message("test_message")
+
+        first = self.transport.receive_messages(visibility_timeout=0.05)
+        self.assertEqual(self.transport.receive_messages(), [])
+        time.sleep(0.05)
+        second = self.transport.receive_messages(
+            attribute_names=["ApproximateReceiveCount"])
+
+        self.assertEqual(
+            second[0]["Attributes"], {"ApproximateReceiveCount": "2"})
+        # Only the latest receipt handle is valid
+        with self.assertRaises(ValueError):
+            self.transport.delete_message(first[0]["ReceiptHandle"])
+        self.transport.delete_message(second[0]["ReceiptHandle"])
+
+    def test_change_message_visibility(self):
+        self.transport.send_message("test_message")
+
+        first = self.transport.receive_messages()
+        self.transport.change_message_visibility(
+            first[0]["ReceiptHandle"], 0)
+        second = self.transport.receive_messages()
+
+        self.assertEqual(second[0]["MessageId"], first[0]["MessageId"])
+
+    def test_long_polling(self):
+        start = time.monotonic()
+        self.assertEqual(
+            self.transport.receive_messages(wait_time_seconds=0.05), [])
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+        self.transport.send_message("test_message", delay_seconds=0.05)
+        messages = self.transport.receive_messages(wait_time_seconds=1)
+        self.assertEqual(len(messages), 1)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_batch(self):
+        for i in range(12):
+            self.transport.send_message(f"test message {i}")
+
+        messages = self.transport.receive_messages(max_number_of_messages=10)
+        self.assertEqual(
+            [message["Body"] for message in messages],
+            [f"test message {i}" for i in range(10)]
+        )
+
+        entries = [
+            {"Id": message["MessageId"],
+             "ReceiptHandle": message["ReceiptHandle"]}
+            for message in messages
+        ]
+        entries[0]["ReceiptHandle"] = "invalid"
+        response = self.transport.delete_message_batch(entries)
+        self.assertEqual(len(response["Successful"]), 9)
+        self.assertEqual(response["Failed"][0]["Id"], entries[0]["Id"])
+        self.assertEqual(len(self.transport), 3)
+
+        with self.assertRaises(ValueError):
+            self.transport.receive_messages(max_number_of_messages=11)
+        with self.assertRaises(ValueError):
+            self.transport.delete_message_batch(entries + entries)
+
+    def test_attribute_names(self):
+        self.transport.send_message(
+            "test_message",
+            message_attributes={
+                "attr1": {"DataType": "String", "StringValue": "value1"},
+                "attr2": {"DataType": "Number", "StringValue": "2"}
+            }
+        )
+
+        message = self.transport.receive_messages(
+            visibility_timeout=0,
+            attribute_names=["All"],
+            message_attribute_names=["attr1"]
+        )[0]
+        self.assertSetEqual(
+            set(message["Attributes"]),
+            {"SentTimestamp", "ApproximateReceiveCount",
+             "ApproximateFirstReceiveTimestamp"}
+        )
+        self.assertEqual(list(message["MessageAttributes"]), ["attr1"])
+
+        message = self.transport.receive_messages()[0]
+        self.assertNotIn("Attributes", message)
+        self.assertNotIn("MessageAttributes", message)
+
+
+class TestConsumeInMemory(unittest.TestCase):
+    def setUp(self) -> None:
+        self.hang = threading.Event()
+
+    def tearDown(self) -> None:
+        # Let abandoned handlers finish
+        self.hang.set()
+
+    def test_message_consume_body(self):
+        messages = []
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                messages.append(message.Body)
+
+        with async_in_memory(TestConsumer) as transport:
+            for i in range(100):
+                transport.send_message(f"test message {i}")
+
+        self.assertEqual(len(transport), 0)
+        self.assertEqual(
+            messages, [f"test message {i}" for i in range(100)])
+
+    def test_message_batch_consume_body(self):
+        message_batches = []
+
+        class TestBatchConsumer(Consumer):
+            def handle_message_batch(self, messages: List[Message]):
+                message_batches.append([message.Body for message in messages])
+
+        with async_in_memory(TestBatchConsumer, batch_size=5) as transport:
+            for i in range(24):
+                transport.send_message(f"test message {i}")
+
+        self.assertEqual(len(transport), 0)
+        self.assertTrue(all(len(batch) <= 5 for batch in message_batches))
+        self.assertEqual(
+            sum(message_batches, []),
+            [f"test message {i}" for i in range(24)]
+        )
+
+    def test_message_visibility_timeout(self):
+        messages = []
+        exceptions = []
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                if message.Attributes["ApproximateReceiveCount"] == "1":
+                    raise Exception("handle exception")
+                messages.append(message.Body)
+
+            def handle_processing_exception(self, message: Message, exception):
+                exceptions.append(exception)
+
+        with async_in_memory(
+            TestConsumer,
+            attribute_names=["ApproximateReceiveCount"],
+            visibility_timeout_seconds=0.05
+        ) as transport:
+            transport.send_message("test_message")
+
+        self.assertEqual(messages, ["test_message"])
+        self.assertEqual(len(exceptions), 1)
+        self.assertEqual(str(exceptions[0]), "handle exception")
+
+    def test_handler_timeout_released(self):
+        messages = []
+        exceptions = []
+        hang = self.hang
+
+        class TestConsumer(Consumer):
+            def handle_message(self, message: Message):
+                if message.Attributes["ApproximateReceiveCount"] == "1":
+                    hang.wait()
+                else:
+                    messages.append(message.Body)
+
+            def handle_processing_exception(self, message: Message, exception):
+                exceptions.append(exception)
+
+        with async_in_memory(
+            TestConsumer,
+            attribute_names=["ApproximateReceiveCount"],
+            handler_timeout_seconds=0.05
+        ) as transport:
+            transport.send_message("test_message")
+
+        self.assertEqual(messages, ["test_message"])
+        self.assertEqual(len(exceptions), 1)
+        self.assertEqual(type(exceptions[0]), HandlerTimeoutException)
@@ -3,6 +3,8 @@ import contextlib
 import threading
 import time
 
+from aws_sqs_consumer import InMemoryTransport
+
 
 @contextlib.contextmanager
 def async_sqs(consumer_class, region="eu-west-1", timeout_seconds=1, **kwargs):
@@ -22,3 +24,28 @@ def async_sqs(consumer_class, region="eu-west-1", timeout_seconds=1, **kwargs):
     time.sleep(timeout_seconds)
     consumer.stop()
     thread.join()
+
+
+@contextlib.contextmanager
+def async_in_memory(consumer_class, timeout_seconds=1, **kwargs):
+    """
+    Run a consumer on an in-memory queue in a background thread.
+    Post context, stop the consumer as soon as the queue is drained,
+    or after `timeout_seconds`.
+    """
+    transport = InMemoryTransport()
+    kwargs.setdefault("wait_time_seconds", 0.01)
+    consumer = consumer_class(
+        queue_url="in-memory", transport=transport, **kwargs
+    )
+
+    thread = threading.Thread(target=consumer.start)
+    thread.start()
+
+    yield transport
+
+    deadline = time.monotonic() + timeout_seconds
+    while len(transport) and time.monotonic() < deadline:
+        time.sleep(0.001)
+    consumer.stop()
+    thread.join()